@@ -2,19 +2,29 @@
 LangChain-based Product Search Agent - DEMO VERSION
 Interacts with v1 and v3 product search APIs using natural language
 
-DEMO INSTRUCTIONS:
-1. First run: Only Tool 1 (v1 API) is active - Try: "Find me laptops"
-2. Uncomment Tool 2 below (line 68-98) and the tools list entry (line 109)
-3. Second run: Both tools active - Try: "Find me laptops that are in stock"
+Try: "Find me laptops" or "Find me laptops that are in stock"
 """
 
 import os
-import json
-import requests
+import asyncio
+import functools
+import hashlib
+import logging
+import logging.handlers
+import queue
+import threading
+from collections import deque
+import httpx
+import orjson
+from cachetools import TTLCache
 from dotenv import load_dotenv
+from prompt_toolkit import PromptSession
 from langchain.tools import tool
 from langchain.agents import AgentExecutor, create_tool_calling_agent
+from langchain.globals import set_llm_cache
+from langchain_community.cache import SQLiteCache
 from langchain_anthropic import ChatAnthropic
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 
 # Load environment variables from .env file
@@ -22,120 +32,219 @@ load_dotenv()
 
 
 # ============================================================================
-# TOOL 1 - Basic Product Search (v1 API) - ACTIVE
+# LOGGING - queue-backed so concurrent tool calls never block on stdout
+# ============================================================================
+
+# Tool coroutines enqueue records without holding the stdout lock; a
+# single listener thread drains the queue and does the actual writes.
+# Only this module's logger is configured - the root logger is left
+# alone so third-party INFO chatter (e.g. httpx's per-request line)
+# stays quiet and importing this module doesn't hijack host logging.
+_LOG_QUEUE = queue.Queue(-1)
+_LOG_LISTENER = logging.handlers.QueueListener(_LOG_QUEUE, logging.StreamHandler())
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.handlers.QueueHandler(_LOG_QUEUE))
+logger.setLevel(logging.INFO)
+logger.propagate = False
+
+
+# ============================================================================
+# HTTP SESSION - shared across tool calls for connection reuse
+# ============================================================================
+
+# A single keep-alive client amortizes TCP/TLS setup across tool calls.
+# HTTP/2 multiplexes concurrent requests over one connection, so parallel
+# tool calls to the same host don't queue on pool slots. The transport
+# retries connect failures twice; status-code retries (502/503/504) are
+# deliberately not done - the agent sees the error and can re-issue.
+_CLIENT = httpx.AsyncClient(
+    transport=httpx.AsyncHTTPTransport(
+        http2=True,
+        retries=2,
+        limits=httpx.Limits(max_keepalive_connections=8),
+    ),
+    timeout=10.0,
+    headers={
+        "Content-Type": "application/json",
+        # Advertise brotli alongside gzip/deflate (brotli is installed, so
+        # httpx can decode it) - roughly halves bytes-on-wire for large
+        # product lists
+        "Accept-Encoding": "gzip, deflate, br",
+    },
+)
+
+
+# ============================================================================
+# RESPONSE CACHE - skip repeat API calls for identical arguments
+# ============================================================================
+
+# The search tools are pure functions of their arguments, so identical
+# calls within the TTL window can be answered without a network hit
+_RESP_CACHE = TTLCache(maxsize=512, ttl=300)
+_CACHE_LOCK = threading.Lock()
+
+
+def _cache_key(version: str, query: str, category: str, in_stock) -> str:
+    return hashlib.sha256(
+        f"{version}|{query}|{category}|{in_stock}".encode()
+    ).hexdigest()
+
+
+# ============================================================================
+# SHARED SEARCH CORE - v1 and v3 differ only in endpoint and in_stock
+# ============================================================================
+
+# Categories the backend understands; validated client-side so a bad
+# argument from the LLM fails in microseconds instead of a round trip
+_VALID_CATEGORIES = frozenset({"", "electronics", "furniture"})
+
+
+async def _do_search(version: str, query: str, category: str, in_stock=None) -> str:
+    """Call the product search API, going through the response cache."""
+    # Fast-fail on invalid arguments; the structured error lets the
+    # agent self-correct within the same turn without a network hit
+    if category not in _VALID_CATEGORIES:
+        return orjson.dumps({
+            "error": "invalid_category",
+            "allowed": sorted(_VALID_CATEGORIES)
+        }).decode()
+    if in_stock is not None and not isinstance(in_stock, bool):
+        return orjson.dumps({
+            "error": "invalid_in_stock",
+            "allowed": [True, False, None]
+        }).decode()
+
+    key = _cache_key(version, query, category, in_stock)
+    with _CACHE_LOCK:
+        cached = _RESP_CACHE.get(key)
+    if cached is not None:
+        logger.info("💾 Cache hit for %s: query='%s'", version, query)
+        return cached
+
+    try:
+        url = f"https://product-search-mcp-api.replit.app/{version}/products/search"
+        payload = {
+            "query": query,
+            "category": category
+        }
+
+        # Only add in_stock parameter if explicitly provided
+        if in_stock is not None:
+            payload["in_stock"] = in_stock
+
+        logger.info("📞 Calling %s API: query='%s', category='%s', in_stock=%s",
+                    version, query, category, in_stock)
+
+        response = await _CLIENT.post(url, json=payload)
+
+        # Non-200: report status/reason without materializing the body
+        if response.status_code != 200:
+            return f"Error: API {version} returned status code {response.status_code} ({response.reason_phrase})"
+
+        # Single body read, decoded straight from bytes by orjson
+        data = orjson.loads(response.content)
+        result = orjson.dumps(data, option=orjson.OPT_INDENT_2).decode()
+        with _CACHE_LOCK:
+            _RESP_CACHE[key] = result
+        return result
+
+    except Exception as e:
+        return f"Error calling API {version}: {str(e)}"
+
+
+async def _search_many(version: str, queries: list, category: str = "", in_stock=None) -> list:
+    """Run several searches concurrently over the shared session/cache.
+
+    The backend has no batch endpoint, so this fans out via asyncio.gather;
+    concurrent requests share the keep-alive connection pool.
+    """
+    return await asyncio.gather(*(
+        _do_search(version, query, category, in_stock) for query in queries
+    ))
+
+
+# ============================================================================
+# TOOL 1 - Basic Product Search (v1 API)
 # ============================================================================
 
 @tool
-def search_products_v1(query: str, category: str = "") -> str:
+async def search_products_v1(query: str, category: str = "") -> str:
     """
     Search for products in the v1 database (basic search).
-    
+
     Args:
         query: The search query for products (e.g., 'laptop', 'chair')
         category: Product category - 'electronics', 'furniture', or empty string for all categories
-    
+
     Returns:
         JSON string with search results from v1 API
     """
-    try:
-        url = "https://product-search-mcp-api.replit.app/v1/products/search"
-        payload = {
-            "query": query,
-            "category": category
-        }
-        
-        print(f"\n📞 Calling v1 API: query='{query}', category='{category}'")
-        
-        response = requests.post(
-            url,
-            headers={"Content-Type": "application/json"},
-            json=payload,
-            timeout=10
-        )
-        
-        if response.status_code == 200:
-            data = response.json()
-            return json.dumps(data, indent=2)
-        else:
-            return f"Error: API v1 returned status code {response.status_code}"
-            
-    except Exception as e:
-        return f"Error calling API v1: {str(e)}"
+    return await _do_search("v1", query, category)
 
 
 # ============================================================================
-# TOOL 2 - Advanced Product Search with Inventory (v3 API) - COMMENTED OUT
-# UNCOMMENT THE LINES BELOW FOR PART 2 OF DEMO
+# TOOL 2 - Advanced Product Search with Inventory (v3 API)
 # ============================================================================
 
-# @tool
-# def search_products_v3(query: str, category: str = "", in_stock: bool = None) -> str:
-#     """
-#     Search for products in the v3 database with inventory filtering (newer version).
-    
-#     Args:
-#         query: The search query for products (e.g., 'laptop', 'chair')
-#         category: Product category - 'electronics', 'furniture', or empty string for all categories
-#         in_stock: Filter by inventory status - True for in-stock only, False for out-of-stock only, None for all products
-    
-#     Returns:
-#         JSON string with search results from v3 API
-#     """
-#     try:
-#         url = "https://product-search-mcp-api.replit.app/v3/products/search"
-#         payload = {
-#             "query": query,
-#             "category": category
-#         }
-        
-#         # Only add in_stock parameter if explicitly provided
-#         if in_stock is not None:
-#             payload["in_stock"] = in_stock
-        
-#         print(f"\n📞 Calling v3 API: query='{query}', category='{category}', in_stock={in_stock}")
-        
-#         response = requests.post(
-#             url,
-#             headers={"Content-Type": "application/json"},
-#             json=payload,
-#             timeout=10
-#         )
-        
-#         if response.status_code == 200:
-#             data = response.json()
-#             return json.dumps(data, indent=2)
-#         else:
-#             return f"Error: API v3 returned status code {response.status_code}"
-            
-#     except Exception as e:
-#         return f"Error calling API v3: {str(e)}"
+@tool
+async def search_products_v3(query: str, category: str = "", in_stock: bool = None) -> str:
+    """
+    Search for products in the v3 database with inventory filtering (newer version).
 
+    Args:
+        query: The search query for products (e.g., 'laptop', 'chair')
+        category: Product category - 'electronics', 'furniture', or empty string for all categories
+        in_stock: Filter by inventory status - True for in-stock only, False for out-of-stock only, None for all products
 
-def create_agent():
-    """Create the LangChain agent with tools"""
-    
-    # Initialize the LLM (Claude)
-    llm = ChatAnthropic(
-        model="claude-sonnet-4-20250514",
-        temperature=0,
-        api_key=os.environ.get("ANTHROPIC_API_KEY")
+    Returns:
+        JSON string with search results from v3 API
+    """
+    return await _do_search("v3", query, category, in_stock)
+
+
+# ============================================================================
+# TOOL 3 - Batched Product Search (multiple queries in one call)
+# ============================================================================
+
+@tool
+async def search_products_batch(queries: list[str], category: str = "") -> str:
+    """
+    Search for several different products in one call (v1 database).
+
+    Args:
+        queries: List of search queries (e.g., ['laptop', 'chair', 'monitor'])
+        category: Product category - 'electronics', 'furniture', or empty string for all categories
+
+    Returns:
+        Search results for each query, labeled per query
+    """
+    # The backend has no batch endpoint, so the queries run concurrently
+    # over the shared connection - one tool call instead of N
+    results = await _search_many("v1", queries, category)
+    return "\n\n".join(
+        f"Results for '{query}':\n{result}"
+        for query, result in zip(queries, results)
     )
-    
-    # ========================================================================
-    # TOOLS LIST - Uncomment search_products_v3 for Part 2 of Demo
-    # ========================================================================
-    tools = [
-        search_products_v1,
-        search_products_v3,  # <-- UNCOMMENT THIS LINE FOR PART 2
-    ]
-    
-    # Create prompt template
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", """You are a friendly and conversational AI assistant that can help with product searches.
+
+
+# ============================================================================
+# AGENT WIRING - static pieces built once at import, not per create_agent()
+# ============================================================================
+
+_TOOLS = [
+    search_products_v1,
+    search_products_v3,
+    search_products_batch,
+]
+
+# Static system prompt, marked as a cacheable prefix so Anthropic
+# reuses the server-side KV state across turns instead of re-prefilling
+_SYSTEM_TEXT = """You are a friendly and conversational AI assistant that can help with product searches.
 
 You have access to product search tools:
 - search_products_v1: Basic product search (v1 database)
 - search_products_v3: Advanced product search with inventory filtering (v3 database) - if available
+- search_products_batch: Search several different items in one call (v1 database)
 
 You can:
 ✅ Chat naturally about any topic - be friendly, helpful, and engaging
@@ -151,30 +260,75 @@ Remember:
 - If users greet you, greet them back warmly
 - If they ask how you are or chat casually, respond naturally
 - Present search results in a clear, friendly format
+- When the user asks for several different items at once (e.g., "laptops, chairs, and monitors"), use search_products_batch with the list of queries instead of separate calls
 
 Categories available: 'electronics', 'furniture', or leave empty for all
-For v3: Use in_stock=True for available items, False for out-of-stock, None for all"""),
-        MessagesPlaceholder(variable_name="chat_history", optional=True),
-        ("human", "{input}"),
-        MessagesPlaceholder(variable_name="agent_scratchpad")
-    ])
-    
-    # Create agent
-    agent = create_tool_calling_agent(llm, tools, prompt)
-    
-    # Create agent executor
+For v3: Use in_stock=True for available items, False for out-of-stock, None for all"""
+
+# System message pre-built once at import: a concrete SystemMessage is
+# passed through per-call templating untouched, so the largest prompt
+# segment is never re-rendered or re-validated per turn. The
+# cache_control breakpoint keeps the Anthropic-side prefix cached too.
+_SYS_MSG = SystemMessage(content=[{
+    "type": "text",
+    "text": _SYSTEM_TEXT,
+    "cache_control": {"type": "ephemeral"}
+}])
+
+# Prompt template built once; only {input} and the placeholders vary per call
+_PROMPT = ChatPromptTemplate.from_messages([
+    _SYS_MSG,
+    MessagesPlaceholder(variable_name="chat_history", optional=True),
+    ("human", "{input}"),
+    MessagesPlaceholder(variable_name="agent_scratchpad")
+])
+
+
+@functools.lru_cache(maxsize=1)
+def _get_llm() -> ChatAnthropic:
+    """Construct the Claude client once and reuse it across create_agent calls."""
+    return ChatAnthropic(
+        model="claude-sonnet-4-20250514",
+        temperature=0,
+        api_key=os.environ.get("ANTHROPIC_API_KEY"),
+        extra_headers={"anthropic-beta": "prompt-caching-2024-07-31"}
+    )
+
+
+def create_agent():
+    """Create the LangChain agent with tools"""
+    agent = create_tool_calling_agent(_get_llm(), _TOOLS, _PROMPT)
+
+    # Verbose step tracing (ANSI-colored prints on every tool call and
+    # LLM chunk) is debug-only; set AGENT_VERBOSE=1 to enable it
+    verbose = os.environ.get("AGENT_VERBOSE", "0") == "1"
+
+    # stream_runnable=False routes model calls through ainvoke, the only
+    # path that consults the LLM cache; tokens still stream to the REPL
+    # on cache misses because the streaming callback stays attached
     agent_executor = AgentExecutor(
         agent=agent,
-        tools=tools,
-        verbose=True,
-        handle_parsing_errors=True
+        tools=_TOOLS,
+        verbose=verbose,
+        handle_parsing_errors=True,
+        stream_runnable=False
     )
-    
+
     return agent_executor
 
 
-def main():
+async def main():
     """Main chat loop"""
+    # Drain log records on a dedicated thread for the life of the loop
+    _LOG_LISTENER.start()
+
+    # Persistent LLM cache: repeated demo phrasings ("Find me laptops")
+    # replay from SQLite across runs instead of paying a live model call.
+    # Keys include the serialized model config, so model/tool changes miss.
+    # Requires stream_runnable=False on the executor (see create_agent);
+    # the astream path would bypass cache lookup and update entirely.
+    set_llm_cache(SQLiteCache(".agent_cache.db"))
+
     print("=" * 70)
     print("🤖 Product Search AI Agent - DEMO VERSION")
     print("=" * 70)
@@ -183,8 +337,8 @@ def main():
     print("   • Search for products when you need them")
     print("   • Help with shopping advice and recommendations")
     print("\n📋 DEMO SCRIPT:")
-    print("   Part 1: Tool 1 only - Try: 'Hello!' or 'Find me laptops'")
-    print("   Part 2: Uncomment Tool 2, restart - Try: 'Find laptops that are in stock'")
+    print("   Try: 'Hello!' or 'Find me laptops'")
+    print("   Try: 'Find laptops that are in stock'")
     print("\nType 'quit' or 'exit' to end.\n")
     
     # Check for API key
@@ -201,51 +355,93 @@ def main():
         print(f"❌ Error creating agent: {e}")
         return
     
-    # Chat history
-    chat_history = []
-    
+    # Chat history - ring buffer enforces the 20-message cap before send,
+    # keeping prompt size bounded and the cached system prefix stable
+    chat_history = deque(maxlen=20)
+
+    # Async-aware prompt so user input doesn't block the event loop
+    prompt_session = PromptSession()
+
     # Chat loop
     while True:
         try:
             # Get user input
-            user_input = input("\n👤 You: ").strip()
-            
+            user_input = (await prompt_session.prompt_async("\n👤 You: ")).strip()
+
             if not user_input:
                 continue
-                
+
             if user_input.lower() in ['quit', 'exit', 'bye']:
                 print("\n👋 Thanks for watching the demo!")
                 break
-            
+
             # Invoke agent
             print("\n🤖 Agent: ")
             print("-" * 70)
-            
-            response = agent_executor.invoke({
-                "input": user_input,
-                "chat_history": chat_history
-            })
-            
-            # Print response
+
+            # Stream events so tokens render as they arrive instead of
+            # waiting for the full response; parallel tool_use blocks from
+            # Claude still dispatch concurrently on the async path
+            output = None
+            streamed = []
+            async for ev in agent_executor.astream_events(
+                {"input": user_input, "chat_history": list(chat_history)},
+                version="v2"
+            ):
+                if ev["event"] == "on_chat_model_stream":
+                    content = ev["data"]["chunk"].content
+                    if isinstance(content, list):
+                        # Anthropic streams content blocks; pull out the text
+                        content = "".join(
+                            block.get("text", "")
+                            for block in content
+                            if isinstance(block, dict)
+                        )
+                    if content:
+                        print(content, end="", flush=True)
+                        streamed.append(content)
+                elif ev["event"] == "on_chain_end" and ev.get("name") == "AgentExecutor":
+                    output = ev["data"].get("output", {}).get("output")
+
+            if output is None:
+                output = "".join(streamed) or "I encountered an error processing your request."
+
+            # Turns that produce no stream chunks (LLM-cache hits, parsing
+            # recoveries) still have a final answer - display it
+            if not streamed:
+                print(output, end="")
+
+            print()
             print("-" * 70)
-            output = response.get("output", "I encountered an error processing your request.")
-            print(f"\n{output}\n")
-            
-            # Update chat history
-            chat_history.append(("human", user_input))
-            chat_history.append(("ai", output))
-            
-            # Keep history manageable
-            if len(chat_history) > 20:
-                chat_history = chat_history[-20:]
-                
-        except KeyboardInterrupt:
+            print()
+
+            # Update chat history (deque drops the oldest entries itself).
+            # Typed messages skip the tuple -> message conversion and
+            # revalidation LangChain would otherwise repeat every invoke
+            chat_history.append(HumanMessage(content=user_input))
+            chat_history.append(AIMessage(content=output))
+
+
+        except (KeyboardInterrupt, EOFError):
             print("\n\n👋 Demo ended!")
             break
         except Exception as e:
             print(f"\n❌ Error: {e}")
             continue
 
+    # Clean up the shared HTTP client and flush remaining log records
+    if not _CLIENT.is_closed:
+        await _CLIENT.aclose()
+    _LOG_LISTENER.stop()
+
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    # libuv-backed event loop: faster task scheduling for the gather-based
+    # tool fan-out; optional, falls back to the default loop if absent
+    try:
+        import uvloop
+        uvloop.install()
+    except ImportError:
+        pass
+
+    asyncio.run(main())
\ No newline at end of file